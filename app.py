@@ -4,32 +4,98 @@ Gemini Image Generator Web UI
 Simple web interface for generating images using Google Gemini AI with cost tracking.
 """
 
+import io
 import os
-import base64
-import tempfile
-from flask import Flask, render_template, request, jsonify, send_file
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from flask import Flask, Response, render_template, request, send_file
 from werkzeug.utils import secure_filename
 from gemini_image_generator import GeminiImageGenerator
+from json_responses import fast_jsonify, StaticJSON
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Global generator instance
-generator = None
+# Model list never changes at runtime, so serialize it once
+_MODELS_RESPONSE = StaticJSON(GeminiImageGenerator.AVAILABLE_MODELS)
+
+# Shared generators, one per model; requests never change a generator's model, so
+# concurrent requests can't mix up each other's model, pricing or cache keys
+DEFAULT_MODEL = 'gemini-2.5-flash-image-preview'
+generators = {}
+_generators_lock = threading.Lock()
+
+# Estimated cost of this server session across all models
+session_total = 0.0
+_session_lock = threading.Lock()
+
+# Generated images waiting to be fetched by the browser: image_id -> (png_bytes, created_at),
+# oldest first; bounded by age, count and total size so memory can't grow with traffic
+IMAGE_TTL_SECONDS = 10 * 60
+IMAGE_STORE_MAX_ITEMS = 64
+IMAGE_STORE_MAX_BYTES = int(os.getenv('IMAGE_STORE_MAX_BYTES', str(256 * 1024 * 1024)))
+generated_images = OrderedDict()
+_images_bytes = 0
+_images_lock = threading.Lock()
+
+# Serve repeated identical requests from the generator's result cache (opt-in)
+USE_RESULT_CACHE = os.getenv('GEMINI_RESULT_CACHE') == '1'
+
+def get_generator(model=DEFAULT_MODEL):
+    """Return the shared generator for a model, or None if GEMINI_API_KEY is not set"""
+    with _generators_lock:
+        generator = generators.get(model)
+        if generator is None:
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                return None
+            generator = GeminiImageGenerator(api_key=api_key, model=model,
+                                             use_cache=USE_RESULT_CACHE)
+            generators[model] = generator
+        return generator
 
 def init_generator():
-    """Initialize the generator with API key"""
-    global generator
-    api_key = os.getenv('GEMINI_API_KEY')
-    if not api_key:
-        return False
+    """Initialize the default model's generator with API key"""
     try:
-        generator = GeminiImageGenerator(api_key=api_key)
-        return True
+        return get_generator() is not None
     except Exception as e:
         print(f"Failed to initialize generator: {e}")
         return False
 
+def add_session_cost(cost):
+    """Add a request's cost to the session total and return the new total"""
+    global session_total
+    with _session_lock:
+        session_total += cost
+        return session_total
+
+# Create the default generator at import so its HTTP client is warm before the first request;
+# routes still retry lazily if GEMINI_API_KEY was missing here
+init_generator()
+
+def store_image(image_data):
+    """Register generated image bytes and return the id they are served under"""
+    global _images_bytes
+    image_id = uuid.uuid4().hex
+    now = time.time()
+    with _images_lock:
+        generated_images[image_id] = (image_data, now)
+        _images_bytes += len(image_data)
+        
+        # Drop images nobody fetched in time, then the oldest while over the caps
+        # (the newest image is always kept)
+        while len(generated_images) > 1:
+            oldest_data, created = next(iter(generated_images.values()))
+            if (now - created <= IMAGE_TTL_SECONDS
+                    and len(generated_images) <= IMAGE_STORE_MAX_ITEMS
+                    and _images_bytes <= IMAGE_STORE_MAX_BYTES):
+                break
+            generated_images.popitem(last=False)
+            _images_bytes -= len(oldest_data)
+    return image_id
+
 @app.route('/')
 def index():
     """Main page"""
@@ -38,14 +104,13 @@ def index():
 @app.route('/api/models')
 def get_models():
     """Get available models with pricing info"""
-    return jsonify(GeminiImageGenerator.AVAILABLE_MODELS)
+    return _MODELS_RESPONSE.response()
 
 @app.route('/api/generate', methods=['POST'])
 def generate_image():
     """Generate image endpoint"""
-    if not generator:
-        if not init_generator():
-            return jsonify({'error': 'Generator not initialized. Check GEMINI_API_KEY'}), 500
+    if not init_generator():
+        return fast_jsonify({'error': 'Generator not initialized. Check GEMINI_API_KEY'}, 500)
     
     try:
         data = request.get_json()
@@ -53,111 +118,121 @@ def generate_image():
         model = data.get('model', 'gemini-2.5-flash-image-preview')
         
         if not prompt:
-            return jsonify({'error': 'Prompt is required'}), 400
-        
-        # Update model if different
-        if generator.model != model:
-            generator.model = model
+            return fast_jsonify({'error': 'Prompt is required'}, 400)
         
-        # Calculate cost
-        cost_info = generator.calculate_cost(prompt, has_input_image=False)
+        generator = get_generator(model)
         
         # Generate image
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-            output_path = generator.generate_image_from_prompt(prompt, tmp_file.name)
-            
-            # Read generated image and encode as base64
-            with open(output_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Clean up temp file
-            os.unlink(output_path)
+        image_data = generator.generate_image_bytes_from_prompt(prompt)
+        
+        # Calculate cost (nothing is charged for a cached result)
+        cost_info = generator.last_request_cost(prompt, has_input_image=False)
+        
+        # Browser fetches the raw PNG from /api/image/<id>
+        image_id = store_image(image_data)
         
         # Update session total
-        generator.total_cost += cost_info['total_cost']
+        total = add_session_cost(cost_info['total_cost'])
         
-        return jsonify({
+        return fast_jsonify({
             'success': True,
-            'image': f"data:image/png;base64,{image_data}",
+            'image': f"/api/image/{image_id}",
+            'image_id': image_id,
             'cost_info': cost_info,
-            'session_total': generator.total_cost
+            'session_total': total
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return fast_jsonify({'error': str(e)}, 500)
 
 @app.route('/api/generate_with_input', methods=['POST'])
 def generate_with_input():
-    """Generate image with input image endpoint"""
-    if not generator:
-        if not init_generator():
-            return jsonify({'error': 'Generator not initialized. Check GEMINI_API_KEY'}), 500
+    """Generate image with input image endpoint
+    
+    Accepts either a multipart form with an 'image' file, or the raw image as an
+    application/octet-stream body with prompt and model in the query string.
+    Raw bodies are streamed straight into memory, skipping multipart parsing.
+    """
+    if not init_generator():
+        return fast_jsonify({'error': 'Generator not initialized. Check GEMINI_API_KEY'}, 500)
     
     try:
+        raw_upload = request.mimetype == 'application/octet-stream'
+        
         # Get form data
-        prompt = request.form.get('prompt', '').strip()
-        model = request.form.get('model', 'gemini-2.5-flash-image-preview')
+        fields = request.args if raw_upload else request.form
+        prompt = fields.get('prompt', '').strip()
+        model = fields.get('model', 'gemini-2.5-flash-image-preview')
         
         if not prompt:
-            return jsonify({'error': 'Prompt is required'}), 400
+            return fast_jsonify({'error': 'Prompt is required'}, 400)
         
         # Get uploaded file
-        if 'image' not in request.files:
-            return jsonify({'error': 'Input image is required'}), 400
+        if raw_upload:
+            file = None
+        else:
+            if 'image' not in request.files:
+                return fast_jsonify({'error': 'Input image is required'}, 400)
+            
+            file = request.files['image']
+            if file.filename == '':
+                return fast_jsonify({'error': 'No file selected'}, 400)
         
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        generator = get_generator(model)
         
-        # Update model if different
-        if generator.model != model:
-            generator.model = model
+        # Read the upload once, straight from the request stream
+        input_data = (request.stream if file is None else file.stream).read()
+        if not input_data:
+            return fast_jsonify({'error': 'Input image is required'}, 400)
         
-        # Calculate cost
-        cost_info = generator.calculate_cost(prompt, has_input_image=True)
+        # Generate image (BytesIO over existing bytes shares them rather than copying)
+        image_data = generator.generate_image_bytes_with_input(io.BytesIO(input_data), prompt)
         
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as input_tmp:
-            file.save(input_tmp.name)
-            
-            # Generate image
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as output_tmp:
-                output_path = generator.generate_image_with_input(
-                    input_tmp.name, prompt, output_tmp.name
-                )
-                
-                # Read generated image and encode as base64
-                with open(output_path, 'rb') as f:
-                    image_data = base64.b64encode(f.read()).decode('utf-8')
-                
-                # Clean up temp files
-                os.unlink(input_tmp.name)
-                os.unlink(output_path)
+        # Calculate cost (nothing is charged for a cached result)
+        cost_info = generator.last_request_cost(prompt, has_input_image=True)
+        
+        # Browser fetches the raw PNG from /api/image/<id>
+        image_id = store_image(image_data)
         
         # Update session total
-        generator.total_cost += cost_info['total_cost']
+        total = add_session_cost(cost_info['total_cost'])
         
-        return jsonify({
+        return fast_jsonify({
             'success': True,
-            'image': f"data:image/png;base64,{image_data}",
+            'image': f"/api/image/{image_id}",
+            'image_id': image_id,
             'cost_info': cost_info,
-            'session_total': generator.total_cost
+            'session_total': total
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return fast_jsonify({'error': str(e)}, 500)
+
+@app.route('/api/image/<image_id>')
+def get_image(image_id):
+    """Serve a generated image as raw PNG bytes"""
+    with _images_lock:
+        entry = generated_images.get(image_id)
+    if not entry or time.time() - entry[1] > IMAGE_TTL_SECONDS:
+        return fast_jsonify({'error': 'Image not found'}, 404)
+    return send_file(io.BytesIO(entry[0]), mimetype='image/png',
+                     conditional=True, etag=image_id)
 
 @app.route('/api/reset_cost')
 def reset_cost():
     """Reset session cost counter"""
-    if generator:
-        generator.total_cost = 0.0
-        return jsonify({'success': True, 'session_total': 0.0})
-    return jsonify({'error': 'Generator not initialized'}), 500
+    global session_total
+    if generators:
+        with _session_lock:
+            session_total = 0.0
+        return fast_jsonify({'success': True, 'session_total': 0.0})
+    return fast_jsonify({'error': 'Generator not initialized'}, 500)
 
 if __name__ == '__main__':
     print("🚀 Starting Gemini Image Generator Web UI...")
     print("💡 Make sure GEMINI_API_KEY environment variable is set")
     print("🌐 Open http://localhost:3001 in your browser")
+    print("🏭 For production use: gunicorn -c gunicorn_conf.py wsgi:app")
     
-    app.run(debug=True, host='127.0.0.1', port=3001)
\ No newline at end of file
+    # Werkzeug's debugger/reloader only when explicitly requested
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='127.0.0.1', port=3001, threaded=True)
\ No newline at end of file
@@ -5,12 +5,16 @@ A Python script that takes an input image and prompt to generate a new image usi
 """
 
 import argparse
+import hashlib
 import os
 import sys
-import base64
-from typing import Optional
-
-from PIL import Image
+import threading
+from collections import OrderedDict
+try:
+    from pybase64 import b64decode as _b64decode  # SIMD-accelerated, same API as stdlib
+except ImportError:
+    from base64 import b64decode as _b64decode
+from typing import BinaryIO, Optional, Union
 
 try:
     from google import genai
@@ -20,6 +24,65 @@ except ImportError:
     sys.exit(1)
 
 
+# Leading bytes of supported image formats -> MIME type
+_IMAGE_SIGNATURES = (
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def _sniff_mime_type(header: bytes, default: str = 'image/jpeg') -> str:
+    """Detect image MIME type from the first 12 bytes of the file"""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mime_type in _IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    return default
+
+
+class ImageResultCache:
+    """Thread-safe LRU cache of generated images keyed by (API key, model, prompt, input image)"""
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(api_key_digest: bytes, model: str, prompt: str, input_data: bytes = b'') -> tuple:
+        """Build a compact cache key; blake2b is cheaper than sha256 for this
+        
+        The API key digest keeps one caller's images from being served to another.
+        """
+        return (
+            api_key_digest,
+            model,
+            hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).digest(),
+            hashlib.blake2b(input_data, digest_size=16).digest(),
+        )
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            image_data = self._items.get(key)
+            if image_data is not None:
+                self._items.move_to_end(key)
+            return image_data
+
+    def put(self, key: tuple, image_data: bytes):
+        with self._lock:
+            self._items[key] = image_data
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
 class GeminiImageGenerator:
     # Available models for image generation with pricing info
     AVAILABLE_MODELS = {
@@ -45,12 +108,19 @@ class GeminiImageGenerator:
         }
     }
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-2.5-flash-image-preview"):
+    # Results shared by all generator instances (entries are scoped to the API key),
+    # so identical requests with use_cache enabled skip the API call
+    result_cache = ImageResultCache(maxsize=32)
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemini-2.5-flash-image-preview",
+                 use_cache: bool = False):
         """Initialize Gemini Image Generator
         
         Args:
             api_key: Gemini API key. If None, will try to get from GEMINI_API_KEY environment variable
             model: Model to use for image generation. Default is gemini-2.5-flash-image-preview
+            use_cache: Return the cached image for repeated identical requests instead of calling the API.
+                Off by default, since the model gives a different image on every call
         """
         if not api_key:
             api_key = os.getenv('GEMINI_API_KEY')
@@ -58,12 +128,29 @@ class GeminiImageGenerator:
         if not api_key:
             raise ValueError("API key is required. Set GEMINI_API_KEY environment variable or pass api_key parameter")
 
+        self.model = model
+        self.client = genai.Client(api_key=api_key)
+        self.use_cache = use_cache
+        self._api_key_digest = hashlib.blake2b(api_key.encode('utf-8'), digest_size=16).digest()
+        # Per-thread record of whether the last result came from the cache
+        self._last_call = threading.local()
+        self.total_cost = 0.0
+
+    @property
+    def model(self) -> str:
+        """Model used for image generation"""
+        return self._model
+
+    @model.setter
+    def model(self, model: str):
         if model not in self.AVAILABLE_MODELS:
             raise ValueError(f"Model '{model}' not supported. Available models: {list(self.AVAILABLE_MODELS.keys())}")
 
-        self.client = genai.Client(api_key=api_key)
-        self.model = model
-        self.total_cost = 0.0
+        # Flatten pricing once per model switch so calculate_cost avoids nested lookups
+        pricing = self.AVAILABLE_MODELS[model]["pricing"]
+        self._input_cost_per_char = pricing["input_cost_per_1k_chars"] / 1000.0
+        self._image_cost = pricing["output_cost_per_image"]
+        self._model = model
 
     @classmethod
     def list_available_models(cls):
@@ -82,34 +169,26 @@ class GeminiImageGenerator:
                 print(f"Output cost: ${pricing.get('output_cost_per_image', 0):.6f} per image")
         print("\n" + "=" * 50)
 
-    def load_image(self, image_path: str) -> tuple[bytes, str]:
+    def load_image(self, image_path: Union[str, BinaryIO]) -> tuple[bytes, str]:
         """Load and convert image to bytes with proper MIME type detection
         
         Args:
-            image_path: Path to input image
+            image_path: Path to input image, or a readable binary file-like object
             
         Returns:
             Tuple of (image data as bytes, mime_type)
         """
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found: {image_path}")
+        if hasattr(image_path, 'read'):
+            image_data = image_path.read()
+        else:
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(f"Image file not found: {image_path}")
 
-        # Detect image format
-        try:
-            with Image.open(image_path) as img:
-                format_map = {
-                    'JPEG': 'image/jpeg',
-                    'PNG': 'image/png', 
-                    'GIF': 'image/gif',
-                    'BMP': 'image/bmp',
-                    'WEBP': 'image/webp'
-                }
-                mime_type = format_map.get(img.format, 'image/jpeg')  # Default to jpeg
-        except Exception:
-            mime_type = 'image/jpeg'  # Fallback
-
-        with open(image_path, 'rb') as f:
-            return f.read(), mime_type
+            with open(image_path, 'rb') as f:
+                image_data = f.read()
+
+        # Detect image format from its magic bytes, defaulting to jpeg
+        return image_data, _sniff_mime_type(image_data[:12])
 
     def calculate_cost(self, prompt: str, has_input_image: bool = False) -> dict:
         """Calculate the estimated cost for the request
@@ -121,17 +200,15 @@ class GeminiImageGenerator:
         Returns:
             Dict with cost breakdown
         """
-        pricing = self.AVAILABLE_MODELS[self.model]["pricing"]
-        
         # Calculate input cost (text prompt)
         input_chars = len(prompt)
-        input_cost = (input_chars / 1000) * pricing["input_cost_per_1k_chars"]
+        input_cost = input_chars * self._input_cost_per_char
         
         # Output cost (generated image)
-        output_cost = pricing["output_cost_per_image"]
+        output_cost = self._image_cost
         
         # Input image processing cost (if any) - same as output cost
-        input_image_cost = pricing["output_cost_per_image"] if has_input_image else 0
+        input_image_cost = self._image_cost if has_input_image else 0
         
         total = input_cost + output_cost + input_image_cost
         
@@ -143,132 +220,284 @@ class GeminiImageGenerator:
             "input_chars": input_chars
         }
 
-    def generate_image_from_prompt(self, prompt: str, output_path: str = "generated_image.png") -> str:
+    def _log_cost(self, cost_info: dict, has_input_image: bool):
+        """Print the cost breakdown for a request with a single write"""
+        lines = [
+            "\n💰 Cost Breakdown:",
+            f"   Input text ({cost_info['input_chars']} chars): ${cost_info['input_text_cost']:.6f}",
+        ]
+        if has_input_image:
+            lines.append(f"   Input image processing: ${cost_info['input_image_cost']:.6f}")
+        lines.append(f"   Output image: ${cost_info['output_image_cost']:.6f}")
+        lines.append(f"   Total: ${cost_info['total_cost']:.6f}")
+        lines.append(f"   Session total: ${self.total_cost:.6f}\n\n")
+        sys.stdout.write("\n".join(lines))
+
+    def generate_image_from_prompt(self, prompt: str,
+                                   output_path: Union[str, BinaryIO] = "generated_image.png") -> Union[str, BinaryIO]:
         """Generate image from text prompt only
         
         Args:
             prompt: Text description of desired image
-            output_path: Path to save generated image
+            output_path: Path to save generated image, or a writable binary file-like object
+            
+        Returns:
+            Path to saved image (or the file-like object it was written to)
+        """
+        image_data = self.generate_image_bytes_from_prompt(prompt)
+        return self._save_image(image_data, output_path)
+
+    def generate_image_with_input(self, input_image_path: Union[str, BinaryIO], prompt: str,
+                                  output_path: Union[str, BinaryIO] = "generated_image.png") -> Union[str, BinaryIO]:
+        """Generate image based on input image and prompt
+        
+        Args:
+            input_image_path: Path to input image, or a readable binary file-like object
+            prompt: Text description for image modification/generation
+            output_path: Path to save generated image, or a writable binary file-like object
             
         Returns:
-            Path to saved image
+            Path to saved image (or the file-like object it was written to)
         """
+        image_data = self.generate_image_bytes_with_input(input_image_path, prompt)
+        return self._save_image(image_data, output_path)
+
+    @staticmethod
+    def _save_image(image_data: bytes, output_path: Union[str, BinaryIO]) -> Union[str, BinaryIO]:
+        """Write generated image data to output_path and return it"""
+        if hasattr(output_path, 'write'):
+            output_path.write(image_data)
+            return output_path
+
+        # Raw fd writes skip the BufferedWriter copy; O_BINARY matters on Windows
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+        fd = os.open(output_path, flags, 0o644)
+        try:
+            # Size the file up front so it is allocated as a single extent
+            os.ftruncate(fd, len(image_data))
+            view = memoryview(image_data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        print(f"Image generated and saved to: {output_path}")
+        return output_path
+
+    def generate_image_bytes_from_prompt(self, prompt: str) -> bytes:
+        """Generate image from text prompt only without writing it to disk
+        
+        Args:
+            prompt: Text description of desired image
+            
+        Returns:
+            Generated image data as bytes
+        """
+        cache_key = self._cache_key(prompt)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
         # Calculate and display cost
         cost_info = self.calculate_cost(prompt, has_input_image=False)
-        print(f"\n💰 Cost Breakdown:")
-        print(f"   Input text ({cost_info['input_chars']} chars): ${cost_info['input_text_cost']:.6f}")
-        print(f"   Output image: ${cost_info['output_image_cost']:.6f}")
-        print(f"   Total: ${cost_info['total_cost']:.6f}")
         self.total_cost += cost_info['total_cost']
-        print(f"   Session total: ${self.total_cost:.6f}\n")
+        self._log_cost(cost_info, has_input_image=False)
 
         try:
             response = self.client.models.generate_content(
                 model=self.model,
                 contents=[prompt],
             )
-
-            if not response:
-                raise ValueError("No response received from Gemini API")
-            
-            if not response.candidates:
-                raise ValueError("No candidates in response")
-
-            # Extract image data from response
-            for candidate in response.candidates:
-                for part in candidate.content.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        # Only process image parts with substantial data
-                        if part.inline_data.mime_type.startswith('image/') and len(part.inline_data.data) > 1000:
-                            # The data is already bytes, not base64 string
-                            if isinstance(part.inline_data.data, bytes):
-                                image_data = part.inline_data.data
-                            else:
-                                # Fallback: try base64 decode
-                                try:
-                                    image_data = base64.b64decode(part.inline_data.data)
-                                except Exception:
-                                    continue
-                            
-                            with open(output_path, 'wb') as f:
-                                f.write(image_data)
-                            print(f"Image generated and saved to: {output_path}")
-                            return output_path
-
-            raise ValueError("No image generated in response")
+            image_data = self._extract_image(response)
 
         except Exception as e:
             raise RuntimeError(f"Failed to generate image: {str(e)}")
 
-    def generate_image_with_input(self, input_image_path: str, prompt: str,
-                                  output_path: str = "generated_image.png") -> str:
-        """Generate image based on input image and prompt
+        self._put_cached(cache_key, image_data)
+        return image_data
+
+    def generate_image_bytes_with_input(self, input_image_path: Union[str, BinaryIO], prompt: str) -> bytes:
+        """Generate image based on input image and prompt without writing it to disk
         
         Args:
-            input_image_path: Path to input image
+            input_image_path: Path to input image, or a readable binary file-like object
             prompt: Text description for image modification/generation
-            output_path: Path to save generated image
             
         Returns:
-            Path to saved image
+            Generated image data as bytes
         """
+        # Load input image
+        input_data, mime_type = self.load_image(input_image_path)
+
+        cache_key = self._cache_key(prompt, input_data)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
         # Calculate and display cost
         cost_info = self.calculate_cost(prompt, has_input_image=True)
-        print(f"\n💰 Cost Breakdown:")
-        print(f"   Input text ({cost_info['input_chars']} chars): ${cost_info['input_text_cost']:.6f}")
-        print(f"   Input image processing: ${cost_info['input_image_cost']:.6f}")
-        print(f"   Output image: ${cost_info['output_image_cost']:.6f}")
-        print(f"   Total: ${cost_info['total_cost']:.6f}")
         self.total_cost += cost_info['total_cost']
-        print(f"   Session total: ${self.total_cost:.6f}\n")
+        self._log_cost(cost_info, has_input_image=True)
 
         try:
-            # Load input image
-            image_data, mime_type = self.load_image(input_image_path)
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=self._input_contents(input_data, mime_type, prompt),
+            )
+            image_data = self._extract_image(response)
+
+        except Exception as e:
+            raise RuntimeError(f"Failed to generate image: {str(e)}")
 
-            # Create content with both image and text
-            contents = [
-                types.Part.from_bytes(data=image_data, mime_type=mime_type),
-                prompt
-            ]
+        self._put_cached(cache_key, image_data)
+        return image_data
 
-            response = self.client.models.generate_content(
+    async def generate_image_bytes_from_prompt_async(self, prompt: str) -> bytes:
+        """Async variant of generate_image_bytes_from_prompt using the non-blocking client
+        
+        Args:
+            prompt: Text description of desired image
+            
+        Returns:
+            Generated image data as bytes
+        """
+        cache_key = self._cache_key(prompt)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
+        # Calculate and display cost
+        cost_info = self.calculate_cost(prompt, has_input_image=False)
+        self.total_cost += cost_info['total_cost']
+        self._log_cost(cost_info, has_input_image=False)
+
+        try:
+            response = await self.client.aio.models.generate_content(
                 model=self.model,
-                contents=contents,
+                contents=[prompt],
             )
+            image_data = self._extract_image(response)
+
+        except Exception as e:
+            raise RuntimeError(f"Failed to generate image: {str(e)}")
+
+        self._put_cached(cache_key, image_data)
+        return image_data
 
-            if not response:
-                raise ValueError("No response received from Gemini API")
+    async def generate_image_bytes_with_input_async(self, input_image_path: Union[str, BinaryIO],
+                                                    prompt: str) -> bytes:
+        """Async variant of generate_image_bytes_with_input using the non-blocking client
+        
+        Args:
+            input_image_path: Path to input image, or a readable binary file-like object
+            prompt: Text description for image modification/generation
             
-            if not response.candidates:
-                raise ValueError("No candidates in response")
-
-            # Extract image data from response
-            for candidate in response.candidates:
-                for part in candidate.content.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        # Only process image parts with substantial data
-                        if part.inline_data.mime_type.startswith('image/') and len(part.inline_data.data) > 1000:
-                            # The data is already bytes, not base64 string
-                            if isinstance(part.inline_data.data, bytes):
-                                image_data = part.inline_data.data
-                            else:
-                                # Fallback: try base64 decode
-                                try:
-                                    image_data = base64.b64decode(part.inline_data.data)
-                                except Exception:
-                                    continue
-                            
-                            with open(output_path, 'wb') as f:
-                                f.write(image_data)
-                            print(f"Image generated and saved to: {output_path}")
-                            return output_path
+        Returns:
+            Generated image data as bytes
+        """
+        # Load input image
+        input_data, mime_type = self.load_image(input_image_path)
 
-            raise ValueError("No image generated in response")
+        cache_key = self._cache_key(prompt, input_data)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+
+        # Calculate and display cost
+        cost_info = self.calculate_cost(prompt, has_input_image=True)
+        self.total_cost += cost_info['total_cost']
+        self._log_cost(cost_info, has_input_image=True)
+
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=self._input_contents(input_data, mime_type, prompt),
+            )
+            image_data = self._extract_image(response)
 
         except Exception as e:
             raise RuntimeError(f"Failed to generate image: {str(e)}")
 
+        self._put_cached(cache_key, image_data)
+        return image_data
+
+    async def generate_image_from_prompt_async(self, prompt: str,
+                                               output_path: Union[str, BinaryIO] = "generated_image.png") -> Union[str, BinaryIO]:
+        """Async variant of generate_image_from_prompt"""
+        image_data = await self.generate_image_bytes_from_prompt_async(prompt)
+        return self._save_image(image_data, output_path)
+
+    async def generate_image_with_input_async(self, input_image_path: Union[str, BinaryIO], prompt: str,
+                                              output_path: Union[str, BinaryIO] = "generated_image.png") -> Union[str, BinaryIO]:
+        """Async variant of generate_image_with_input"""
+        image_data = await self.generate_image_bytes_with_input_async(input_image_path, prompt)
+        return self._save_image(image_data, output_path)
+
+    @property
+    def last_result_cached(self) -> bool:
+        """Whether the last image generated on this thread was served from the result cache"""
+        return getattr(self._last_call, 'from_cache', False)
+
+    def last_request_cost(self, prompt: str, has_input_image: bool = False) -> dict:
+        """Cost of the request just made on this thread; zero if it was served from the cache"""
+        cost_info = self.calculate_cost(prompt, has_input_image)
+        if self.last_result_cached:
+            cost_info.update(input_text_cost=0.0, input_image_cost=0, output_image_cost=0,
+                             total_cost=0.0, cached=True)
+        return cost_info
+
+    def _cache_key(self, prompt: str, input_data: bytes = b'') -> tuple:
+        """Result cache key for a request made with this generator's API key and model"""
+        return ImageResultCache.make_key(self._api_key_digest, self.model, prompt, input_data)
+
+    def _get_cached(self, cache_key: tuple) -> Optional[bytes]:
+        """Return the cached image for this request, if caching is enabled and it exists"""
+        image_data = self.result_cache.get(cache_key) if self.use_cache else None
+        self._last_call.from_cache = image_data is not None
+        if image_data is not None:
+            print("Returning cached image for identical request (no API cost)")
+        return image_data
+
+    def _put_cached(self, cache_key: tuple, image_data: bytes):
+        """Remember a generated image for identical future requests"""
+        if self.use_cache:
+            self.result_cache.put(cache_key, image_data)
+
+    @staticmethod
+    def _input_contents(image_data: bytes, mime_type: str, prompt: str) -> list:
+        """Build request contents with both the input image and the text prompt"""
+        return [
+            types.Part.from_bytes(data=image_data, mime_type=mime_type),
+            prompt
+        ]
+
+    @staticmethod
+    def _extract_image(response) -> bytes:
+        """Extract generated image data from a generate_content response"""
+        if not response:
+            raise ValueError("No response received from Gemini API")
+        
+        if not response.candidates:
+            raise ValueError("No candidates in response")
+
+        # First image part with substantial data, stopping as soon as one is found
+        data = next((
+            part.inline_data.data
+            for candidate in response.candidates
+            for part in candidate.content.parts
+            if getattr(part, 'inline_data', None)
+            and part.inline_data.mime_type[:6] == 'image/'
+            and len(part.inline_data.data) > 1000
+        ), None)
+
+        if data is None:
+            raise ValueError("No image generated in response")
+
+        # The data is already bytes, not base64 string
+        if isinstance(data, bytes):
+            return data
+
+        # Fallback: base64 decode, skipping alphabet validation for speed
+        return _b64decode(data, validate=False)
 
 def main():
     parser = argparse.ArgumentParser(description="Generate images using Google Gemini AI")
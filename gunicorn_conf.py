@@ -0,0 +1,21 @@
+"""
+Gunicorn configuration for the Gemini Image Generator web apps.
+
+Usage:
+    gunicorn -c gunicorn_conf.py wsgi:app      # web UI (app.py)
+    gunicorn -c gunicorn_conf.py web_api:app   # web API (web_api.py)
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:3001')
+
+# Generated images, session cost and async tasks live in process memory, so
+# a single worker process is used; concurrency comes from threads, which
+# spend nearly all their time waiting on the Gemini API.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+# Image generation regularly takes longer than gunicorn's 30s default
+timeout = 120
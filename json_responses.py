@@ -0,0 +1,35 @@
+"""
+JSON response helpers shared by the Gemini Image Generator web apps.
+"""
+
+import hashlib
+try:
+    from orjson import dumps as json_dumps
+except ImportError:  # orjson has no PyPy build; fall back to stdlib json there
+    import json
+
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+from flask import Response, request
+
+__all__ = ["json_dumps", "fast_jsonify", "StaticJSON"]
+
+
+def fast_jsonify(obj, status=200):
+    """jsonify replacement that serializes with orjson when available"""
+    return Response(json_dumps(obj), status=status, mimetype='application/json')
+
+
+class StaticJSON:
+    """JSON payload that never changes at runtime, serialized once and served with an ETag"""
+
+    def __init__(self, payload, max_age=3600):
+        self.body = json_dumps(payload)
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=8).hexdigest() + '"'
+        self.headers = {'ETag': self.etag, 'Cache-Control': f'public, max-age={max_age}'}
+
+    def response(self):
+        """Return the payload, or 304 when the client already has this version"""
+        if request.headers.get('If-None-Match') == self.etag:
+            return Response(status=304, headers=self.headers)
+        return Response(self.body, mimetype='application/json', headers=self.headers)
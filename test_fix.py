@@ -27,11 +27,11 @@ def test_image_generation():
         
         # Check if file was created and is valid PNG
         if os.path.exists(result):
-            import subprocess
-            file_info = subprocess.run(['file', result], capture_output=True, text=True)
-            print(f"Generated file info: {file_info.stdout.strip()}")
+            with open(result, 'rb') as fh:
+                is_png = fh.read(8) == b'\x89PNG\r\n\x1a\n'
+            print(f"Generated file size: {os.path.getsize(result)} bytes")
             
-            if "PNG image data" in file_info.stdout:
+            if is_png:
                 print("✅ SUCCESS: Image generated correctly as PNG format!")
             else:
                 print("❌ FAILED: Image is not in correct PNG format")
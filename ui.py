@@ -6,10 +6,11 @@ A simple GUI interface for generating images using Google Gemini AI.
 
 import os
 import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from PIL import Image, ImageTk
-import threading
 from pathlib import Path
 
 try:
@@ -18,8 +19,17 @@ except ImportError:
     print("Error: Could not import GeminiImageGenerator")
     sys.exit(1)
 
+# How often Tk hands control to the asyncio loop (milliseconds)
+ASYNC_POLL_MS = 50
+
+# Maximum preview dimensions
+PREVIEW_SIZE = (300, 300)
+
 
 class GeminiImageGeneratorUI:
+    # Model info text, shared by all instances once built
+    _info_text = None
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Gemini Image Generator")
@@ -32,10 +42,39 @@ class GeminiImageGeneratorUI:
         self.input_image_path = tk.StringVar()
         self.output_path = tk.StringVar(value="generated_image.png")
         self.prompt_text = tk.StringVar()
+        self.use_cache_var = tk.BooleanVar(value=False)
         
         self.generator = None
+        # Generators reused across runs, keyed by (api_key, model)
+        self._generator_cache = {}
+        self._info_window = None
         self.setup_ui()
         
+        # asyncio loop driven from Tk's event loop, so coroutines run on the Tk thread
+        self.loop = asyncio.new_event_loop()
+        self.poll_async_loop()
+        
+        # Preview decoding runs here so large images don't stall the Tk thread
+        self._preview_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='preview')
+        
+    def poll_async_loop(self):
+        """Run any ready asyncio callbacks, then hand control back to Tk"""
+        # A modal dialog opened from a coroutine spins Tk's event loop while the
+        # asyncio loop is still running; wait until the coroutine yields again
+        if not self.loop.is_running():
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()
+        self.root.after(ASYNC_POLL_MS, self.poll_async_loop)
+    
+    def close_async_loop(self):
+        """Cancel any generation still in flight and close the asyncio loop"""
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.close()
+        self._preview_pool.shutdown(wait=False)
+        
     def setup_ui(self):
         # Main frame
         main_frame = ttk.Frame(self.root, padding="10")
@@ -73,6 +112,8 @@ class GeminiImageGeneratorUI:
         
         ttk.Button(model_frame, text="Info", command=self.show_model_info).grid(
             row=0, column=1, padx=(5, 0))
+        ttk.Checkbutton(model_frame, text="Reuse cached results",
+                        variable=self.use_cache_var).grid(row=0, column=2, padx=(5, 0))
         model_frame.columnconfigure(0, weight=1)
         row += 1
         
@@ -175,61 +216,97 @@ class GeminiImageGeneratorUI:
         if file_path:
             self.output_path.set(file_path)
     
+    @staticmethod
+    def _model_info_text():
+        """Build the model info text (models are constant, so only once)"""
+        parts = ["Available Gemini Image Generation Models:\n", "=" * 50, "\n\n"]
+        for model_id, info in GeminiImageGenerator.AVAILABLE_MODELS.items():
+            parts.append(
+                f"Model ID: {model_id}\n"
+                f"Name: {info['name']}\n"
+                f"Status: {info['status']}\n"
+                f"Description: {info['description']}\n"
+                f"Features: {', '.join(info['features'])}\n"
+                "\n" + "-" * 40 + "\n\n"
+            )
+        return "".join(parts)
+    
     def show_model_info(self):
         """Show information about available models"""
+        # Closing only hides the window, so later clicks just bring it back
+        if self._info_window is not None:
+            self._info_window.deiconify()
+            self._info_window.lift()
+            return
+        
+        if GeminiImageGeneratorUI._info_text is None:
+            GeminiImageGeneratorUI._info_text = self._model_info_text()
+        
         info_window = tk.Toplevel(self.root)
         info_window.title("Model Information")
         info_window.geometry("600x400")
+        info_window.protocol("WM_DELETE_WINDOW", info_window.withdraw)
         
         text_widget = scrolledtext.ScrolledText(info_window, wrap=tk.WORD, padx=10, pady=10)
         text_widget.pack(fill=tk.BOTH, expand=True)
         
-        info_text = "Available Gemini Image Generation Models:\n"
-        info_text += "=" * 50 + "\n\n"
-        
-        for model_id, info in GeminiImageGenerator.AVAILABLE_MODELS.items():
-            info_text += f"Model ID: {model_id}\n"
-            info_text += f"Name: {info['name']}\n"
-            info_text += f"Status: {info['status']}\n"
-            info_text += f"Description: {info['description']}\n"
-            info_text += f"Features: {', '.join(info['features'])}\n"
-            info_text += "\n" + "-" * 40 + "\n\n"
-        
-        text_widget.insert(tk.END, info_text)
+        text_widget.insert(tk.END, self._info_text)
         text_widget.config(state=tk.DISABLED)
+        self._info_window = info_window
     
     def update_status(self, message):
         """Update status label"""
         self.status_label.config(text=message)
         self.root.update_idletasks()
     
-    def show_preview(self, image_path):
+    @staticmethod
+    def _decode_preview(image_path):
+        """Load and shrink an image to preview size (runs on a worker thread)"""
+        with Image.open(image_path) as image:
+            if image.format == 'JPEG':
+                # Let libjpeg decode at a reduced scale near the preview size
+                image.draft('RGB', PREVIEW_SIZE)
+            # Bilinear is indistinguishable from Lanczos at thumbnail size
+            image.thumbnail(PREVIEW_SIZE, Image.Resampling.BILINEAR)
+            # thumbnail() skips loading images that already fit; read pixels before the file closes
+            image.load()
+            return image
+    
+    async def show_preview(self, image_path):
         """Show preview of generated image"""
         try:
-            # Load and resize image for preview
-            image = Image.open(image_path)
-            image.thumbnail((300, 300), Image.Resampling.LANCZOS)
+            image = await self.loop.run_in_executor(
+                self._preview_pool, self._decode_preview, image_path
+            )
             
-            # Convert to PhotoImage
+            # PhotoImage must be created back on the Tk thread
             photo = ImageTk.PhotoImage(image)
             
             # Update preview label
             self.preview_label.config(image=photo, text="")
-            self.preview_label.image = photo  # Keep a reference
+            # Keep a reference; rebinding lets the previous preview's Tk image be freed
+            self.preview_label.image = photo
             
         except Exception as e:
             self.preview_label.config(text=f"Error loading preview: {str(e)}", image="")
             self.preview_label.image = None
     
-    def generate_image_thread(self):
-        """Generate image in separate thread"""
+    def _collect_inputs(self):
+        """Read all form fields in one pass for a generation run"""
+        return (
+            self.api_key_var.get().strip(),
+            self.model_var.get(),
+            self.input_image_path.get().strip(),
+            self.output_path.get().strip(),
+            # 'end-1c' skips the newline Tk always keeps at the end of a Text widget
+            self.prompt_text_widget.get('1.0', 'end-1c').strip(),
+        )
+    
+    async def generate_image_task(self):
+        """Generate image without blocking the UI"""
         try:
             # Get values
-            api_key = self.api_key_var.get().strip()
-            model = self.model_var.get()
-            input_path = self.input_image_path.get().strip()
-            output_path = self.output_path.get().strip()
-            prompt = self.prompt_text_widget.get(1.0, tk.END).strip()
+            api_key, model, input_path, output_path, prompt = self._collect_inputs()
             
             # Validate inputs
             if not api_key:
@@ -241,22 +318,26 @@ class GeminiImageGeneratorUI:
             
             # Initialize generator
             self.update_status("Initializing generator...")
-            self.generator = GeminiImageGenerator(api_key=api_key, model=model)
+            self.generator = self._generator_cache.get((api_key, model))
+            if self.generator is None:
+                self.generator = GeminiImageGenerator(api_key=api_key, model=model)
+                self._generator_cache[(api_key, model)] = self.generator
+            self.generator.use_cache = self.use_cache_var.get()
             
             # Generate image
             if input_path and os.path.exists(input_path):
                 self.update_status("Generating image with input...")
-                result_path = self.generator.generate_image_with_input(
+                result_path = await self.generator.generate_image_with_input_async(
                     input_path, prompt, output_path
                 )
             else:
                 self.update_status("Generating image from prompt...")
-                result_path = self.generator.generate_image_from_prompt(
+                result_path = await self.generator.generate_image_from_prompt_async(
                     prompt, output_path
                 )
             
             # Show preview
-            self.root.after(0, lambda: self.show_preview(result_path))
+            await self.show_preview(result_path)
             self.update_status(f"Success! Image saved to: {result_path}")
             
         except Exception as e:
@@ -264,7 +345,7 @@ class GeminiImageGeneratorUI:
             messagebox.showerror("Error", f"Failed to generate image: {str(e)}")
         finally:
             # Re-enable button and stop progress
-            self.root.after(0, self.generation_finished)
+            self.generation_finished()
     
     def generation_finished(self):
         """Called when generation is finished"""
@@ -277,16 +358,15 @@ class GeminiImageGeneratorUI:
         self.generate_btn.config(state=tk.DISABLED)
         self.progress.start()
         
-        # Start generation in separate thread
-        thread = threading.Thread(target=self.generate_image_thread)
-        thread.daemon = True
-        thread.start()
+        # Run generation on the asyncio loop; the API call awaits without blocking Tk
+        self.loop.create_task(self.generate_image_task())
 
 
 def main():
     root = tk.Tk()
     app = GeminiImageGeneratorUI(root)
     root.mainloop()
+    app.close_async_loop()
 
 
 if __name__ == "__main__":
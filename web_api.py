@@ -7,12 +7,20 @@ A simple Flask web API with HTML interface for generating images using Google Ge
 import os
 import sys
 import uuid
-import base64
+import shutil
+import time
+try:
+    import pybase64 as base64  # SIMD-accelerated, same API as stdlib base64
+except ImportError:
+    import base64
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, Response, request, render_template, send_file
 from werkzeug.utils import secure_filename
 import threading
-import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from json_responses import json_dumps, fast_jsonify, StaticJSON
 
 try:
     from gemini_image_generator import GeminiImageGenerator
@@ -25,14 +33,82 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
 
+# The model table is constant, so serialize it and its ETag once at import
+_MODELS_RESPONSE = StaticJSON({
+    'success': True,
+    'models': GeminiImageGenerator.AVAILABLE_MODELS
+})
+
+# Let a front-end server that understands X-Sendfile (Apache mod_xsendfile, lighttpd)
+# stream generated files instead of Python; leave off behind plain nginx
+app.use_x_sendfile = os.getenv('USE_X_SENDFILE') == '1'
+
+_UPLOAD_DIR = Path(app.config['UPLOAD_FOLDER'])
+_OUTPUT_DIR = Path(app.config['OUTPUT_FOLDER'])
+
 # Create directories if they don't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+_UPLOAD_DIR.mkdir(exist_ok=True)
+_OUTPUT_DIR.mkdir(exist_ok=True)
 os.makedirs('templates', exist_ok=True)
 os.makedirs('static', exist_ok=True)
 
-# Store active generation tasks
-active_tasks = {}
+def remove_task_file(task):
+    """Delete a task's generated image, if it has one
+    
+    Never raises: it runs inside cache eviction, where an error would orphan the
+    remaining expired files and fail whichever request triggered the eviction.
+    """
+    if not task.result_path:
+        return
+    try:
+        os.remove(task.result_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Failed to remove {task.result_path}: {e}", file=sys.stderr)
+
+class TaskCache(TTLCache):
+    """TTLCache that deletes a task's output file when the task is evicted"""
+    
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, task in expired:
+            remove_task_file(task)
+        return expired
+    
+    def popitem(self):
+        task_id, task = super().popitem()
+        remove_task_file(task)
+        return task_id, task
+
+# Store active generation tasks; they expire (with their files) after an hour.
+# Accessed from request and generation threads, so always hold _tasks_lock.
+TASK_TTL_SECONDS = 3600
+active_tasks = TaskCache(maxsize=10_000, ttl=TASK_TTL_SECONDS)
+_tasks_lock = threading.RLock()
+
+# TTLCache only evicts when touched, so sweep it periodically to delete
+# files of expired tasks even when no requests come in
+TASK_SWEEP_SECONDS = 300
+
+def sweep_expired_tasks():
+    """Evict expired tasks (and their files) every TASK_SWEEP_SECONDS"""
+    while True:
+        time.sleep(TASK_SWEEP_SECONDS)
+        try:
+            with _tasks_lock:
+                active_tasks.expire()
+        except Exception as e:
+            # Keep sweeping; a dead sweeper would let old files pile up again
+            print(f"Task sweep failed: {e}", file=sys.stderr)
+
+threading.Thread(target=sweep_expired_tasks, name='task-sweeper', daemon=True).start()
+
+# Bounded pool for background generations; the work is I/O-bound waiting on Gemini,
+# so reusing a fixed set of threads avoids spawning one per request
+GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', '8'))
+generation_pool = ThreadPoolExecutor(max_workers=GENERATION_WORKERS,
+                                     thread_name_prefix='generation')
 
 class GenerationTask:
     def __init__(self, task_id):
@@ -42,11 +118,74 @@ class GenerationTask:
         self.message = "Task created"
         self.result_path = None
         self.error = None
+        self.created_at = time.time()
+        # Bumped on every update; status streams wait on `changed` for a new version
+        self.version = 0
+        self.changed = threading.Condition()
+    
+    def update(self, **fields):
+        """Set task fields and wake any status streams waiting on this task"""
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+    
+    def to_status(self):
+        """Status payload shared by the polling and streaming endpoints"""
+        response = {
+            'success': True,
+            'task_id': self.task_id,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message
+        }
+        
+        if self.status == "completed" and self.result_path:
+            response['download_url'] = f"/api/download/{self.task_id}"
+            response['preview_url'] = f"/api/preview/{self.task_id}"
+        elif self.status == "error":
+            response['error'] = self.error
+        
+        return response
+
+# Serve repeated identical requests from the generator's result cache (opt-in);
+# cached images are scoped to the API key that generated them
+USE_RESULT_CACHE = os.getenv('GEMINI_RESULT_CACHE') == '1'
+
+@functools.lru_cache(maxsize=32)
+def get_generator(api_key, model):
+    """Return a shared generator per (api_key, model) so its HTTP client stays warm"""
+    return GeminiImageGenerator(api_key=api_key, model=model, use_cache=USE_RESULT_CACHE)
+
+# Copy uploads to disk in large chunks rather than Werkzeug's 16 KiB default
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def save_upload(file, path):
+    """Write an uploaded file to path in UPLOAD_CHUNK_SIZE chunks"""
+    with open(path, 'wb', buffering=0) as dst:
+        shutil.copyfileobj(file.stream, dst, UPLOAD_CHUNK_SIZE)
+
+ALLOWED_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff')
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_SUFFIXES)
+
+# Read size for streamed base64 output; a multiple of 3 so chunks encode independently
+IMAGE_CHUNK_SIZE = 57 * 1024
+
+def stream_image_response(image_path, cost_info, session_total):
+    """Stream the JSON result, base64-encoding the image one chunk at a time"""
+    def chunks():
+        yield b'{"success":true,"image":"data:image/png;base64,'
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(IMAGE_CHUNK_SIZE), b''):
+                yield base64.b64encode(chunk)
+        yield (b'","cost_info":' + json_dumps(cost_info) +
+               b',"session_total":' + json_dumps(session_total) + b'}')
+    
+    return Response(chunks(), mimetype='application/json')
 
 @app.route('/')
 def index():
@@ -56,17 +195,7 @@ def index():
 @app.route('/api/models', methods=['GET'])
 def get_models():
     """Get available Gemini models"""
-    try:
-        models = GeminiImageGenerator.AVAILABLE_MODELS
-        return jsonify({
-            'success': True,
-            'models': models
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return _MODELS_RESPONSE.response()
 
 @app.route('/api/generate', methods=['POST'])
 def generate_image():
@@ -85,155 +214,244 @@ def generate_image():
         
         # Validate required fields
         if not api_key:
-            return jsonify({'success': False, 'error': 'API key is required'}), 400
+            return fast_jsonify({'success': False, 'error': 'API key is required'}, 400)
         if not prompt:
-            return jsonify({'success': False, 'error': 'Prompt is required'}), 400
+            return fast_jsonify({'success': False, 'error': 'Prompt is required'}, 400)
         
         # For text-to-image (no file upload), generate directly
         try:
             # Create generator
-            generator = GeminiImageGenerator(api_key, model)
+            generator = get_generator(api_key, model)
             
             # Generate output path
-            output_filename = f"generated_{uuid.uuid4()}.png"
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+            output_path = str(_OUTPUT_DIR / f"generated_{uuid.uuid4().hex}.png")
             
             # Generate image
             result_path = generator.generate_image_from_prompt(prompt, output_path)
             
-            # Read generated image and encode as base64
-            with open(result_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Calculate cost
-            cost_info = generator.calculate_cost(prompt, has_input_image=False)
+            # Calculate cost (nothing is charged for a cached result)
+            cost_info = generator.last_request_cost(prompt, has_input_image=False)
             
             # Update session total (simple tracking)
             session_total = cost_info['total_cost']
             
-            return jsonify({
-                'success': True,
-                'image': f"data:image/png;base64,{image_data}",
-                'cost_info': cost_info,
-                'session_total': session_total
-            })
+            # Stream the image back as base64 while it is being encoded
+            return stream_image_response(result_path, cost_info, session_total)
             
         except Exception as e:
-            return jsonify({
+            return fast_jsonify({
                 'success': False,
                 'error': str(e)
-            }), 500
+            }, 500)
         
     except Exception as e:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 def generate_image_background(task, api_key, model, prompt, input_file_path):
     """Background task for image generation"""
     try:
-        task.status = "initializing"
-        task.progress = 10
-        task.message = "Initializing generator..."
+        task.update(status="initializing", progress=10,
+                    message="Initializing generator...")
         
         # Initialize generator
-        generator = GeminiImageGenerator(api_key=api_key, model=model)
+        generator = get_generator(api_key, model)
         
-        task.status = "generating"
-        task.progress = 30
-        task.message = "Generating image..."
+        task.update(status="generating", progress=30,
+                    message="Generating image...")
         
         # Generate unique output filename
-        output_filename = f"generated_{task.task_id}.png"
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+        output_path = str(_OUTPUT_DIR / f"generated_{task.task_id}.png")
         
         # Generate image
         if input_file_path and os.path.exists(input_file_path):
-            task.message = "Generating image with input..."
+            task.update(message="Generating image with input...")
             result_path = generator.generate_image_with_input(
                 input_file_path, prompt, output_path
             )
         else:
-            task.message = "Generating image from prompt..."
+            task.update(message="Generating image from prompt...")
             result_path = generator.generate_image_from_prompt(
                 prompt, output_path
             )
         
-        task.status = "completed"
-        task.progress = 100
-        task.message = "Image generated successfully!"
-        task.result_path = result_path
+        task.update(status="completed", progress=100,
+                    message="Image generated successfully!",
+                    result_path=result_path)
         
         # Clean up input file
         if input_file_path and os.path.exists(input_file_path):
             os.remove(input_file_path)
             
     except Exception as e:
-        task.status = "error"
-        task.error = str(e)
-        task.message = f"Error: {str(e)}"
+        task.update(status="error", error=str(e),
+                    message=f"Error: {str(e)}")
         
         # Clean up input file on error
         if input_file_path and os.path.exists(input_file_path):
             os.remove(input_file_path)
 
+@app.route('/api/generate_async', methods=['POST'])
+def generate_image_async():
+    """Queue a generation in the background and return a task id to poll"""
+    try:
+        # Get data from JSON or form
+        if request.is_json:
+            data = request.get_json()
+            api_key = data.get('api_key')
+            model = data.get('model', 'gemini-2.5-flash-image-preview')
+            prompt = data.get('prompt')
+            file = None
+        else:
+            api_key = request.form.get('api_key')
+            model = request.form.get('model', 'gemini-2.5-flash-image-preview')
+            prompt = request.form.get('prompt')
+            file = request.files.get('image')
+        
+        # Validate required fields
+        if not api_key:
+            return fast_jsonify({'success': False, 'error': 'API key is required'}, 400)
+        if not prompt:
+            return fast_jsonify({'success': False, 'error': 'Prompt is required'}, 400)
+        
+        # Save optional input image
+        input_file_path = None
+        if file and file.filename:
+            if not allowed_file(file.filename):
+                return fast_jsonify({'success': False, 'error': 'Invalid file type'}, 400)
+            filename = secure_filename(file.filename)
+            unique_filename = f"{uuid.uuid4().hex}_{filename}"
+            input_file_path = str(_UPLOAD_DIR / unique_filename)
+            save_upload(file, input_file_path)
+        
+        task_id = uuid.uuid4().hex
+        task = GenerationTask(task_id)
+        with _tasks_lock:
+            active_tasks[task_id] = task
+        generation_pool.submit(generate_image_background, task, api_key, model, prompt, input_file_path)
+        
+        return fast_jsonify({
+            'success': True,
+            'task_id': task_id,
+            'status_url': f"/api/status/{task_id}",
+            'stream_url': f"/api/status/{task_id}/stream"
+        }, 202)
+        
+    except Exception as e:
+        return fast_jsonify({
+            'success': False,
+            'error': str(e)
+        }, 500)
+
 @app.route('/api/status/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     """Get status of generation task"""
-    if task_id not in active_tasks:
-        return jsonify({
+    with _tasks_lock:
+        task = active_tasks.get(task_id)
+    if task is None:
+        return fast_jsonify({
             'success': False,
             'error': 'Task not found'
-        }), 404
+        }, 404)
     
-    task = active_tasks[task_id]
+    return fast_jsonify(task.to_status())
+
+# Seconds between keep-alive comments on an idle status stream
+SSE_KEEPALIVE_SECONDS = 15
+
+# Each open stream holds a server thread until its task finishes, so cap them
+# well below gunicorn's thread count; clients over the cap get a 503 and should
+# fall back to polling /api/status/<task_id>
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '8'))
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+@app.route('/api/status/<task_id>/stream', methods=['GET'])
+def stream_task_status(task_id):
+    """Push task status as Server-Sent Events whenever it changes"""
+    with _tasks_lock:
+        task = active_tasks.get(task_id)
+    if task is None:
+        return fast_jsonify({
+            'success': False,
+            'error': 'Task not found'
+        }, 404)
     
-    response = {
-        'success': True,
-        'task_id': task_id,
-        'status': task.status,
-        'progress': task.progress,
-        'message': task.message
-    }
+    if not _sse_slots.acquire(blocking=False):
+        return fast_jsonify({
+            'success': False,
+            'error': 'Too many status streams; poll the status_url instead',
+            'status_url': f"/api/status/{task_id}"
+        }, 503)
     
-    if task.status == "completed" and task.result_path:
-        response['download_url'] = f"/api/download/{task_id}"
-        response['preview_url'] = f"/api/preview/{task_id}"
-    elif task.status == "error":
-        response['error'] = task.error
+    def event_stream():
+        seen_version = -1
+        while True:
+            # Only snapshot under the lock; yielding inside it would block task.update()
+            # for as long as the client takes to read
+            with task.changed:
+                changed = task.changed.wait_for(lambda: task.version != seen_version,
+                                                timeout=SSE_KEEPALIVE_SECONDS)
+                if changed:
+                    seen_version = task.version
+                    status = task.to_status()
+            
+            if not changed:
+                # Stop streaming once the task has been cleaned up or expired
+                with _tasks_lock:
+                    gone = active_tasks.get(task_id) is not task
+                if gone:
+                    yield b"data: " + json_dumps({
+                        'success': False,
+                        'task_id': task_id,
+                        'status': 'error',
+                        'error': 'Task not found'
+                    }) + b"\n\n"
+                    return
+                yield b": keep-alive\n\n"
+                continue
+            
+            yield b"data: " + json_dumps(status) + b"\n\n"
+            if status['status'] in ("completed", "error"):
+                return
     
-    return jsonify(response)
+    response = Response(event_stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Free the slot when the stream ends or the client disconnects
+    response.call_on_close(_sse_slots.release)
+    return response
 
 @app.route('/api/download/<task_id>')
 def download_image(task_id):
     """Download generated image"""
-    if task_id not in active_tasks:
-        return jsonify({'error': 'Task not found'}), 404
-    
-    task = active_tasks[task_id]
+    with _tasks_lock:
+        task = active_tasks.get(task_id)
+    if task is None:
+        return fast_jsonify({'error': 'Task not found'}, 404)
     if task.status != "completed" or not task.result_path:
-        return jsonify({'error': 'Image not ready'}), 400
-    
-    if not os.path.exists(task.result_path):
-        return jsonify({'error': 'File not found'}), 404
+        return fast_jsonify({'error': 'Image not ready'}, 400)
     
-    return send_file(task.result_path, as_attachment=True)
+    try:
+        return send_file(task.result_path, as_attachment=True, conditional=True,
+                         etag=True, max_age=3600)
+    except FileNotFoundError:
+        return fast_jsonify({'error': 'File not found'}, 404)
 
 @app.route('/api/preview/<task_id>')
 def preview_image(task_id):
     """Preview generated image"""
-    if task_id not in active_tasks:
-        return jsonify({'error': 'Task not found'}), 404
-    
-    task = active_tasks[task_id]
+    with _tasks_lock:
+        task = active_tasks.get(task_id)
+    if task is None:
+        return fast_jsonify({'error': 'Task not found'}, 404)
     if task.status != "completed" or not task.result_path:
-        return jsonify({'error': 'Image not ready'}), 400
-    
-    if not os.path.exists(task.result_path):
-        return jsonify({'error': 'File not found'}), 404
+        return fast_jsonify({'error': 'Image not ready'}, 400)
     
-    return send_file(task.result_path)
+    try:
+        return send_file(task.result_path, conditional=True, etag=True, max_age=3600)
+    except FileNotFoundError:
+        return fast_jsonify({'error': 'File not found'}, 404)
 
 @app.route('/api/generate_with_input', methods=['POST'])
 def generate_with_input():
@@ -246,116 +464,64 @@ def generate_with_input():
         
         # Validate required fields
         if not api_key:
-            return jsonify({'success': False, 'error': 'API key is required'}), 400
+            return fast_jsonify({'success': False, 'error': 'API key is required'}, 400)
         if not prompt:
-            return jsonify({'success': False, 'error': 'Prompt is required'}), 400
+            return fast_jsonify({'success': False, 'error': 'Prompt is required'}, 400)
         
         # Handle file upload
         if 'image' not in request.files:
-            return jsonify({'success': False, 'error': 'Input image is required'}), 400
+            return fast_jsonify({'success': False, 'error': 'Input image is required'}, 400)
         
         file = request.files['image']
         if not file or not file.filename:
-            return jsonify({'success': False, 'error': 'No file selected'}), 400
+            return fast_jsonify({'success': False, 'error': 'No file selected'}, 400)
         
         if not allowed_file(file.filename):
-            return jsonify({'success': False, 'error': 'Invalid file type'}), 400
+            return fast_jsonify({'success': False, 'error': 'Invalid file type'}, 400)
         
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        input_file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(input_file_path)
+        # Create generator
+        generator = get_generator(api_key, model)
         
-        try:
-            # Create generator
-            generator = GeminiImageGenerator(api_key, model)
-            
-            # Generate output path
-            output_filename = f"generated_{uuid.uuid4()}.png"
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-            
-            # Generate image
-            result_path = generator.generate_image_with_input(
-                input_file_path, prompt, output_path
-            )
-            
-            # Read generated image and encode as base64
-            with open(result_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Calculate cost
-            cost_info = generator.calculate_cost(prompt, has_input_image=True)
-            
-            # Update session total (simple tracking)
-            session_total = cost_info['total_cost']
-            
-            return jsonify({
-                'success': True,
-                'image': f"data:image/png;base64,{image_data}",
-                'cost_info': cost_info,
-                'session_total': session_total
-            })
-            
-        finally:
-            # Clean up input file
-            if os.path.exists(input_file_path):
-                os.remove(input_file_path)
+        # Generate output path
+        output_path = str(_OUTPUT_DIR / f"generated_{uuid.uuid4().hex}.png")
+        
+        # Generate image, reading the upload straight from the request stream
+        result_path = generator.generate_image_with_input(
+            file.stream, prompt, output_path
+        )
+        
+        # Calculate cost (nothing is charged for a cached result)
+        cost_info = generator.last_request_cost(prompt, has_input_image=True)
+        
+        # Update session total (simple tracking)
+        session_total = cost_info['total_cost']
+        
+        # Stream the image back as base64 while it is being encoded
+        return stream_image_response(result_path, cost_info, session_total)
         
     except Exception as e:
-        return jsonify({
+        return fast_jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/api/cleanup/<task_id>', methods=['DELETE'])
 def cleanup_task(task_id):
     """Clean up task and associated files"""
-    if task_id not in active_tasks:
-        return jsonify({'error': 'Task not found'}), 404
-    
-    task = active_tasks[task_id]
-    
-    # Remove output file
-    if task.result_path and os.path.exists(task.result_path):
-        os.remove(task.result_path)
-    
-    # Remove task from active tasks
-    del active_tasks[task_id]
-    
-    return jsonify({'success': True, 'message': 'Task cleaned up'})
-
-def cleanup_old_tasks():
-    """Periodic cleanup of old tasks"""
-    current_time = time.time()
-    to_remove = []
-    
-    for task_id, task in active_tasks.items():
-        # Remove tasks older than 1 hour
-        if hasattr(task, 'created_at'):
-            if current_time - task.created_at > 3600:  # 1 hour
-                to_remove.append(task_id)
-        
-        # Clean up completed/error tasks older than 10 minutes
-        if task.status in ["completed", "error"]:
-            if not hasattr(task, 'finished_at'):
-                task.finished_at = current_time
-            elif current_time - task.finished_at > 600:  # 10 minutes
-                to_remove.append(task_id)
+    # Remove the task and its output file together, so the sweeper can't race us
+    with _tasks_lock:
+        task = active_tasks.pop(task_id, None)
+        if task is None:
+            return fast_jsonify({'error': 'Task not found'}, 404)
+        remove_task_file(task)
     
-    for task_id in to_remove:
-        if task_id in active_tasks:
-            task = active_tasks[task_id]
-            if task.result_path and os.path.exists(task.result_path):
-                os.remove(task.result_path)
-            del active_tasks[task_id]
-
-# Start cleanup thread
-cleanup_thread = threading.Thread(target=lambda: [time.sleep(300), cleanup_old_tasks()])
-cleanup_thread.daemon = True
-cleanup_thread.start()
+    return fast_jsonify({'success': True, 'message': 'Task cleaned up'})
 
 if __name__ == '__main__':
+    # The Werkzeug server is for local development only; deployments use gunicorn
+    if os.getenv('FLASK_DEV') != '1':
+        sys.exit("Run with: gunicorn -c gunicorn_conf.py web_api:app "
+                 "(or set FLASK_DEV=1 for the development server)")
     print("Starting Gemini Image Generator Web API...")
     print("Open your browser and go to: http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
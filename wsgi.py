@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for the Gemini Image Generator Web UI.
+
+Run with: gunicorn -c gunicorn_conf.py wsgi:app
+"""
+
+from app import app
+
+__all__ = ["app"]